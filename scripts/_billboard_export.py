@@ -0,0 +1,580 @@
+"""
+Fetching and exporting helpers shared by the chart scripts in this folder:
+rate limiting, retries, HTTP session/cache setup, the valid-dates list and
+the per-week JSON / JSON Lines writers.
+
+pip install billboard.py
+"""
+
+import email.utils
+import functools
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timezone
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+import billboard  # billboard.py
+import requests  # installed with billboard.py
+from bs4 import BeautifulSoup  # installed with billboard.py
+try:
+  import lxml
+except ImportError:
+  lxml = None
+try:
+  import orjson
+except ImportError:
+  orjson = None
+try:
+  import requests_cache
+except ImportError:
+  requests_cache = None
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "billboard-trivia")
+# The valid-dates list is published for the Hot 100.
+VALID_DATES_CHART = "hot-100"
+VALID_DATES_URL = "https://raw.githubusercontent.com/mhollingshead/billboard-hot-100/main/valid_dates.json"
+VALID_DATES_CACHE = os.path.join(CACHE_DIR, "valid_dates.json")
+VALID_DATES_META = os.path.join(CACHE_DIR, "valid_dates.meta.json")
+CHART_URL_DATE = re.compile(r"/charts/[^/]+/(\d{4}-\d{2}-\d{2})")
+# Default worker threads, i.e. max chart weeks fetched at once.
+FETCH_CONCURRENCY = 8
+# Default sustained Billboard request rate (requests/second) for bulk exports.
+DEFAULT_RATE = 4.0
+# Retries per chart fetch after a transient HTTP failure, and the backoff cap in seconds.
+DEFAULT_RETRIES = 3
+RETRY_MAX_DELAY = 30.0
+# JsonlWriter lines buffered per gather-write.
+AGGREGATE_BATCH = 64
+
+
+class RateLimiter:
+  """
+  Token bucket shared by fetch threads: allows bursts of up to `max_tokens`
+  requests, then refills at `rate` tokens per second. A rate of 0 disables it.
+  """
+
+  def __init__(self, rate: float, max_tokens: float | None = None):
+    self.rate = rate
+    self.max_tokens = max_tokens if max_tokens is not None else max(1.0, rate)
+    self.tokens = self.max_tokens
+    self.updated_at = time.monotonic()
+    self._lock = threading.Lock()
+
+  @classmethod
+  def from_interval(cls, seconds: float) -> "RateLimiter":
+    """One request every `seconds`, without bursts."""
+    return cls(1 / seconds if seconds > 0 else 0, max_tokens=1)
+
+  def add_new_tokens(self):
+    now = time.monotonic()
+    new_tokens = (now - self.updated_at) * self.rate
+    self.tokens = min(self.tokens + new_tokens, self.max_tokens)
+    self.updated_at = now
+
+  def wait_for_token(self):
+    if self.rate <= 0:
+      return
+    while True:
+      with self._lock:
+        self.add_new_tokens()
+        if self.tokens >= 1:
+          self.tokens -= 1
+          return
+        delay = (1 - self.tokens) / self.rate
+      time.sleep(delay)
+
+
+def dump_json(obj, indent: bool = True) -> bytes:
+  """UTF-8 JSON bytes, via orjson when available; same layout as json.dumps(indent=2)."""
+  if orjson is not None:
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+  return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None,
+                    separators=None if indent else (",", ":")).encode("utf-8")
+
+
+def write_bytes(path: str, data: bytes):
+  """Write `data` to `path` with a bare open/write/close, skipping the buffered file layer."""
+  fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o666)
+  try:
+    view = memoryview(data)
+    while view:
+      view = view[os.write(fd, view):]
+  finally:
+    os.close(fd)
+
+
+def writev_all(fd: int, chunks: list[bytes]):
+  """Write all chunks to `fd` with one writev() per pass, resuming after short writes."""
+  views = [memoryview(c) for c in chunks if c]
+  i = 0
+  while i < len(views):
+    n = os.writev(fd, views[i:]) if hasattr(os, "writev") else os.write(fd, views[i])
+    while i < len(views) and n >= len(views[i]):
+      n -= len(views[i])
+      i += 1
+    if n:
+      views[i] = views[i][n:]
+
+
+@functools.lru_cache(maxsize=None)
+def ensure_dir(path: str):
+  """os.makedirs once per directory per run; backfills write many files into the same one."""
+  os.makedirs(path, exist_ok=True)
+
+
+def _add_key(keys: set[tuple[str, str]], line: bytes):
+  try:
+    record = json.loads(line)
+    keys.add((record["chart"], record["date"]))
+  except (ValueError, KeyError, TypeError):
+    pass  # partial line from an interrupted run
+
+
+class JsonlWriter:
+  """
+  Appends one compact JSON record per line to a single file, optionally
+  through a zstd stream. Lines are buffered and flushed `batch_size` at a
+  time with a single writev(). Safe to share between fetch threads.
+
+  The (chart, date) keys already in the file are loaded into `existing` on
+  open, so a rerun can skip them; with `force` nothing is skipped, so no
+  lines are parsed. Lines go out in completion order, not
+  date order.
+  """
+
+  def __init__(self, path: str, compress: bool = False, batch_size: int = AGGREGATE_BATCH, force: bool = False):
+    if compress and zstandard is None:
+      raise RuntimeError("--zstd needs the zstandard package (pip install zstandard)")
+    self.path = path
+    self.batch_size = batch_size
+    out_dir = os.path.dirname(path)
+    if out_dir:
+      ensure_dir(out_dir)
+    self.existing = self._read_existing_keys(compress, force)
+    if compress:
+      self._fd = None
+      self._zstd = zstandard.ZstdCompressor().stream_writer(open(path, "ab"))
+    else:
+      self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0), 0o666)
+      self._zstd = None
+    self._pending: list[bytes] = []
+    self._lock = threading.Lock()
+    if self._needs_newline:
+      # An interrupted run left a partial last line; start ours on a fresh one
+      self._pending.append(b"\n")
+
+  def _read_existing_keys(self, compress: bool, force: bool) -> set[tuple[str, str]]:
+    self._needs_newline = False
+    if not os.path.exists(self.path):
+      return set()
+    if compress:
+      return self._read_zstd_keys(force)
+    if force:
+      # Still check for a partial last line from an interrupted run
+      with open(self.path, "rb") as src:
+        src.seek(0, os.SEEK_END)
+        if src.tell():
+          src.seek(-1, os.SEEK_END)
+          self._needs_newline = src.read(1) != b"\n"
+      return set()
+    keys = set()
+    with open(self.path, "rb") as src:
+      line = b""
+      for line in src:
+        _add_key(keys, line)
+      self._needs_newline = bool(line) and not line.endswith(b"\n")
+    return keys
+
+  def _read_zstd_keys(self, force: bool) -> set[tuple[str, str]]:
+    """
+    Keys from every complete zstd frame (each run writes one). A last frame
+    cut short by an interrupted run is truncated off so new frames follow a
+    good one; a damaged frame anywhere else raises RuntimeError instead.
+    """
+    keys, frame_keys = set(), set()
+    good_end = offset = 0  # good_end: just past the last complete frame
+    tail = b""
+    dobj = zstandard.ZstdDecompressor().decompressobj()
+    with open(self.path, "rb") as raw:
+      while chunk := raw.read(1 << 20):
+        offset += len(chunk)
+        while chunk:
+          try:
+            lines = (tail + dobj.decompress(chunk)).split(b"\n")
+          except zstandard.ZstdError as exc:
+            raise RuntimeError(f"{self.path} has a damaged zstd frame after byte {good_end}: {exc}") from exc
+          tail = lines.pop()
+          if not force:
+            for line in lines:
+              _add_key(frame_keys, line)
+          if not dobj.eof:
+            break
+          chunk = dobj.unused_data
+          good_end = offset - len(chunk)
+          keys |= frame_keys
+          frame_keys, tail = set(), b""
+          dobj = zstandard.ZstdDecompressor().decompressobj()
+    if good_end < offset:
+      log(f"Truncating an incomplete zstd frame off the end of {self.path} ({offset - good_end} bytes)", err=True)
+      os.truncate(self.path, good_end)
+    return keys
+
+  def write(self, record: dict):
+    line = dump_json(record, indent=False) + b"\n"
+    with self._lock:
+      self._pending.append(line)
+      if len(self._pending) >= self.batch_size:
+        self._flush()
+
+  def _flush(self):
+    if not self._pending:
+      return
+    if self._zstd:
+      self._zstd.write(b"".join(self._pending))
+    else:
+      writev_all(self._fd, self._pending)
+    self._pending.clear()
+
+  def close(self):
+    with self._lock:
+      self._flush()
+    if self._zstd:
+      self._zstd.close()
+    else:
+      os.close(self._fd)
+
+
+def log(msg: str, err: bool = False):
+  """print() for worker threads: one write per line, so concurrent lines don't interleave."""
+  (sys.stderr if err else sys.stdout).write(msg + "\n")
+
+
+def install_http_cache(refresh: bool = False, settled_through: str | None = None):
+  """
+  Route billboard.py's requests through a persistent SQLite cache. Only chart
+  weeks dated on or before `settled_through` (the last valid date) are stored,
+  and since published weeks never change they never expire. The latest chart,
+  newer weeks (billboard.com answers those with the nearest chart) and, when
+  `settled_through` is None, every week are fetched fresh each time.
+  `refresh` clears the cache. No-op when requests-cache isn't installed.
+  """
+  if requests_cache is None:
+    return
+
+  def settled(response: requests.Response) -> bool:
+    match = CHART_URL_DATE.search(response.url)
+    return bool(settled_through and match and match.group(1) <= settled_through)
+
+  os.makedirs(CACHE_DIR, exist_ok=True)
+  requests_cache.install_cache(os.path.join(CACHE_DIR, "billboard_cache"), backend="sqlite", expire_after=None,
+                               filter_fn=settled)
+  if refresh:
+    requests_cache.clear()
+
+
+def share_http_session(workers: int = FETCH_CONCURRENCY):
+  """
+  Make billboard.py reuse one pooled requests.Session instead of opening a
+  new one, and a new TLS connection, for every chart it fetches. The pool
+  keeps a connection per worker thread. Call after install_http_cache() so
+  the pooled session is also the cached one.
+
+  billboard.py's own adapter retries (max_retries=5) are dropped so that
+  get_chart(), with its rate limiting and backoff, is the only retry policy.
+  """
+  pool_size = max(workers, FETCH_CONCURRENCY)
+  session = requests.Session()
+  session.mount("https://", requests.adapters.HTTPAdapter(
+      pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0))
+  billboard._get_session_with_retries = lambda max_retries: session
+
+
+def _lxml_soup(markup, features=None, *args, **kwargs) -> BeautifulSoup:
+  return BeautifulSoup(markup, "lxml", *args, **kwargs)
+
+
+def use_fast_html_parser():
+  """
+  Have billboard.py build its soup with lxml's C parser instead of the
+  pure-Python "html.parser" it asks for. No-op when lxml isn't installed.
+  """
+  if lxml is not None:
+    billboard.BeautifulSoup = _lxml_soup
+
+
+def parse_iso_date(s: str) -> date:
+  """YYYY-MM-DD to a date by slicing, skipping strptime's per-call format parsing."""
+  if len(s) != 10 or s[4] != "-" or s[7] != "-" or not (s[:4] + s[5:7] + s[8:]).isdigit():
+    raise ValueError(f"time data {s!r} does not match format '%Y-%m-%d'")
+  return date(int(s[:4]), int(s[5:7]), int(s[8:]))
+
+
+def _read_cached_valid_dates() -> tuple[bytes | None, dict]:
+  try:
+    with open(VALID_DATES_CACHE, "rb") as f:
+      body = f.read()
+  except OSError:
+    return None, {}
+  try:
+    with open(VALID_DATES_META, encoding="utf-8") as f:
+      meta = json.load(f)
+  except (OSError, ValueError):
+    meta = {}
+  return body, meta
+
+
+def _write_cached_valid_dates(body: bytes, etag: str | None, last_modified: str | None):
+  try:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(VALID_DATES_CACHE, "wb") as f:
+      f.write(body)
+    with open(VALID_DATES_META, "w", encoding="utf-8") as f:
+      json.dump({"etag": etag, "last_modified": last_modified}, f)
+  except OSError as exc:
+    print(f"Could not cache valid dates list: {exc}", file=sys.stderr)
+
+
+@functools.lru_cache(maxsize=None)
+def load_valid_dates(timeout: float) -> list[str]:
+  """
+  Sorted list of valid chart dates. The last download is kept in CACHE_DIR and
+  revalidated with If-None-Match/If-Modified-Since, so an unchanged list costs
+  a 304 with no body. Falls back to the cached copy if the fetch fails.
+  Raises RuntimeError if no usable list can be loaded.
+  """
+  cached, meta = _read_cached_valid_dates()
+  headers = {"User-Agent": "billboard-trivia/1.0"}
+  if cached is not None:
+    if meta.get("etag"):
+      headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+      headers["If-Modified-Since"] = meta["last_modified"]
+  req = Request(VALID_DATES_URL, headers=headers)
+  fresh = None
+  try:
+    with urlopen(req, timeout=timeout) as resp:
+      fresh = (resp.read(), resp.headers.get("ETag"), resp.headers.get("Last-Modified"))
+  except HTTPError as exc:
+    if cached is None:
+      raise RuntimeError(f"Failed to fetch valid dates list: {exc}") from exc
+    if exc.code != 304:
+      print(f"Failed to fetch valid dates list ({exc}); using cached copy.", file=sys.stderr)
+  except Exception as exc:
+    if cached is None:
+      raise RuntimeError(f"Failed to fetch valid dates list: {exc}") from exc
+    print(f"Failed to fetch valid dates list ({exc}); using cached copy.", file=sys.stderr)
+  payload = fresh[0] if fresh else cached
+  try:
+    data = json.loads(payload)
+  except json.JSONDecodeError as exc:
+    raise RuntimeError(f"Failed to parse valid dates JSON: {exc}") from exc
+  if not isinstance(data, list) or not all(isinstance(d, str) for d in data):
+    raise RuntimeError("Valid dates payload is not a list of strings.")
+  if fresh:
+    _write_cached_valid_dates(*fresh)
+  return sorted(set(data))
+
+
+def default_out_path(chart_slug: str, week: str) -> str:
+  safe_chart = chart_slug.replace("/", "-")
+  return f"public/charts/{safe_chart}/{safe_chart}-{week}.json"
+
+
+def existing_output(chart_slug: str, week: str, out_path: str | None, aggregate: JsonlWriter | None) -> str | None:
+  """
+  Where this week was already exported, if it was: the aggregate file when it
+  holds the week, else the default per-week file if it's on disk. An explicit
+  --out target never matches. Output is keyed by the chart's own date, so only
+  exact chart dates match: a week billboard.com rounds to the nearest chart
+  is fetched again on every run.
+  """
+  if aggregate:
+    return aggregate.path if (chart_slug, week) in aggregate.existing else None
+  if out_path:
+    return None
+  path = default_out_path(chart_slug, week)
+  return path if os.path.exists(path) else None
+
+
+def is_transient(exc: Exception) -> bool:
+  """Worth retrying: timeouts, dropped connections, 429 and 5xx responses."""
+  if isinstance(exc, (requests.Timeout, requests.ConnectionError)):
+    return True
+  if isinstance(exc, requests.HTTPError) and exc.response is not None:
+    return exc.response.status_code == 429 or exc.response.status_code >= 500
+  return False
+
+
+def retry_after(exc: Exception) -> float | None:
+  """Seconds a 429 response asked us to wait via Retry-After, if it said."""
+  response = getattr(exc, "response", None)
+  if response is None or response.status_code != 429:
+    return None
+  value = response.headers.get("Retry-After")
+  if not value:
+    return None
+  try:
+    return max(0.0, float(value))
+  except ValueError:
+    pass
+  try:
+    when = email.utils.parsedate_to_datetime(value)
+  except (TypeError, ValueError):
+    return None
+  if when.tzinfo is None:
+    when = when.replace(tzinfo=timezone.utc)
+  return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def get_chart(chart_slug: str, limiter: RateLimiter | None = None, retries: int = DEFAULT_RETRIES,
+              **kwargs) -> billboard.ChartData:
+  """
+  billboard.ChartData(chart_slug, **kwargs), gated by `limiter`. Transient
+  failures are retried up to `retries` times with exponential backoff
+  (1s, 2s, 4s, ... up to RETRY_MAX_DELAY) plus up to 1s of jitter, or longer
+  if a 429 response's Retry-After asks for it.
+  """
+  retries = max(0, retries)
+  for attempt in range(retries + 1):
+    if limiter:
+      limiter.wait_for_token()
+    try:
+      return billboard.ChartData(chart_slug, **kwargs)
+    except Exception as exc:
+      if attempt == retries or not is_transient(exc):
+        raise
+      delay = min(RETRY_MAX_DELAY, 2 ** attempt) + random.random()
+      delay = max(delay, retry_after(exc) or 0.0)
+      label = kwargs.get("date") or kwargs.get("year") or "latest"
+      log(f"{chart_slug} {label}: {exc}; retry {attempt + 1}/{retries} in {delay:.1f}s", err=True)
+      time.sleep(delay)
+
+
+def fetch_chart(chart_slug: str, week: str, timeout: float = 25.0,
+                limiter: RateLimiter | None = None, retries: int = DEFAULT_RETRIES) -> billboard.ChartData:
+  log(f"Fetching chart '{chart_slug}' for week {week} ...")
+  chart = get_chart(chart_slug, limiter, retries, date=week, timeout=timeout)
+  if not chart:
+    raise LookupError(f"No chart returned for {chart_slug} on {week}")
+  return chart
+
+
+def write_chart(chart: billboard.ChartData, chart_slug: str, week: str, out_path: str | None,
+                aggregate: JsonlWriter | None = None):
+  # Construct entries
+  data = []
+  for e in chart:
+    last_week = None if (e.lastPos is None or e.lastPos == 0) else e.lastPos
+    entry = {
+        "song": e.title,
+        "artist": e.artist,
+        "this_week": e.rank,
+        "last_week": last_week,
+        "peak_position": e.peakPos,
+        "weeks_on_chart": e.weeks,
+        "new": bool(getattr(e, "isNew", False))
+    }
+    data.append(entry)
+
+  payload = {"date": chart.date, "data": data}
+
+  if aggregate:
+    aggregate.write({"chart": chart_slug, **payload})
+    out_path = aggregate.path
+  elif not out_path:
+    # If no output path provided, build one
+    out_path = default_out_path(chart_slug, chart.date)
+
+  if not aggregate:
+    # Ensure output directory exists
+    out_dir = os.path.dirname(out_path)
+    if out_dir:
+      ensure_dir(out_dir)
+
+    # Write JSON
+    write_bytes(out_path, dump_json(payload))
+
+  if chart.date != week:
+    log(f"Note: requested {week}, got nearest available {chart.date}; "
+        f"use {chart.date} so reruns skip it.", err=True)
+  log(f"Wrote {len(data)} entries to {out_path}")
+
+
+def export_chart(chart_slug: str, week: str, out_path: str | None, timeout: float = 25.0,
+                 aggregate: JsonlWriter | None = None, force: bool = False, retries: int = DEFAULT_RETRIES):
+  existing = None if force else existing_output(chart_slug, week, out_path, aggregate)
+  if existing:
+    print(f"Skipping {chart_slug} for week {week}: already exported to {existing}")
+    return
+  try:
+    chart = fetch_chart(chart_slug, week, timeout, retries=retries)
+  except LookupError as exc:
+    print(exc, file=sys.stderr)
+    sys.exit(1)
+  write_chart(chart, chart_slug, week, out_path, aggregate)
+
+
+def run_in_threads(func, items, workers: int = FETCH_CONCURRENCY, on_error=None) -> list:
+  """
+  Call func(item) for every item on a pool of `workers` threads. Results come
+  back in input order, with exceptions returned in place; `on_error(item, exc)`
+  is also called as each failure comes in.
+  """
+  items = list(items)
+  results = [None] * len(items)
+  with ThreadPoolExecutor(max_workers=workers) as ex:
+    futures = {ex.submit(func, item): i for i, item in enumerate(items)}
+    try:
+      for fut in as_completed(futures):
+        i = futures[fut]
+        try:
+          results[i] = fut.result()
+        except Exception as exc:
+          results[i] = exc
+          if on_error:
+            on_error(items[i], exc)
+    except KeyboardInterrupt:
+      # Don't start queued work; only wait for requests already in flight
+      ex.shutdown(wait=False, cancel_futures=True)
+      raise
+  return results
+
+
+def export_weeks(charts: list[str], weeks: list[str], out_path: str | None, timeout: float = 25.0,
+                 workers: int = FETCH_CONCURRENCY, rate: float = DEFAULT_RATE,
+                 aggregate: JsonlWriter | None = None, force: bool = False,
+                 retries: int = DEFAULT_RETRIES) -> int:
+  """
+  Export every week of every chart concurrently. billboard.py is blocking, so
+  each chart week runs on one shared pool of `workers` threads, with no more
+  than `rate` requests started per second. Weeks already exported are
+  skipped unless `force` is set, so an interrupted backfill can be rerun.
+  Returns the number of chart weeks that failed.
+  """
+  limiter = RateLimiter(rate)
+  jobs = [(chart_slug, week) for chart_slug in charts for week in weeks]
+
+  def export_week(job: tuple[str, str]):
+    chart_slug, week = job
+    existing = None if force else existing_output(chart_slug, week, out_path, aggregate)
+    if existing:
+      log(f"Skipping {chart_slug} for week {week}: already exported to {existing}")
+      return
+    chart = fetch_chart(chart_slug, week, timeout, limiter, retries)
+    write_chart(chart, chart_slug, week, out_path, aggregate)
+
+  def report(job: tuple[str, str], exc: Exception):
+    print(f"Failed to export {job[0]} for {job[1]}: {exc}", file=sys.stderr)
+
+  results = run_in_threads(export_week, jobs, workers, on_error=report)
+  return sum(isinstance(r, Exception) for r in results)
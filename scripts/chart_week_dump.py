@@ -6,10 +6,10 @@
 
 import argparse
 import csv
-import json
 import sys
-from datetime import datetime
+from dataclasses import dataclass, field
 import billboard  # pip install billboard.py
+from _billboard_export import dump_json, parse_iso_date, use_fast_html_parser
 
 FIELDS = [
     "rank", "title", "artist",
@@ -17,6 +17,12 @@ FIELDS = [
     "isNew",   # <— added
     "image"
 ]
+# Printed table columns (all FIELDS but image) and their widths
+COLW = {
+    "rank": 4, "title": 40, "artist": 28,
+    "lastPos": 7, "peakPos": 7, "weeks": 5, "isNew": 3
+}
+ROW_FMT = "  ".join("{:<%d}" % w for w in COLW.values())
 
 
 def parse_args():
@@ -31,62 +37,88 @@ def parse_args():
 
 def validate_date(dstr: str) -> str:
   try:
-    datetime.strptime(dstr, "%Y-%m-%d")
+    parse_iso_date(dstr)
     return dstr
   except ValueError:
     print(f"Error: '{dstr}' is not a valid YYYY-MM-DD date.", file=sys.stderr)
     sys.exit(2)
 
 
-def chart_to_rows(chart: billboard.ChartData):
-  rows = []
+@dataclass(slots=True)
+class Rows:
+  """Chart entries stored column-wise: one list per name in FIELDS, index = row."""
+  rank: list[int] = field(default_factory=list)
+  title: list[str] = field(default_factory=list)
+  artist: list[str] = field(default_factory=list)
+  lastPos: list[int | None] = field(default_factory=list)
+  peakPos: list[int | None] = field(default_factory=list)
+  weeks: list[int | None] = field(default_factory=list)
+  isNew: list[bool] = field(default_factory=list)
+  image: list[str | None] = field(default_factory=list)
+
+  def __len__(self):
+    return len(self.rank)
+
+  def tuples(self):
+    """Rows as tuples in FIELDS order."""
+    return zip(*(getattr(self, f) for f in FIELDS))
+
+  def records(self) -> list[dict]:
+    """Rows as dicts keyed by FIELDS, for JSON output."""
+    return [dict(zip(FIELDS, t)) for t in self.tuples()]
+
+
+def chart_to_rows(chart: billboard.ChartData) -> Rows:
+  rows = Rows()
   for e in chart:
-    rows.append({
-        "rank": e.rank,
-        "title": e.title,
-        "artist": e.artist,
-        "lastPos": e.lastPos,
-        "peakPos": e.peakPos,
-        "weeks": e.weeks,
-        "isNew": bool(getattr(e, "isNew", False)),  # <— added
-        "image": getattr(e, "image", None),
-    })
+    rows.rank.append(e.rank)
+    rows.title.append(e.title)
+    rows.artist.append(e.artist)
+    rows.lastPos.append(e.lastPos)
+    rows.peakPos.append(e.peakPos)
+    rows.weeks.append(e.weeks)
+    rows.isNew.append(bool(getattr(e, "isNew", False)))  # <— added
+    rows.image.append(getattr(e, "image", None))
   return rows
 
 
-def print_table(rows, chart_name: str, date_str: str):
+def _trim(s, w: int):
+  return s if len(str(s)) <= w else s[:w-1] + "…"
+
+
+def print_table(rows: Rows, chart_name: str, date_str: str):
   if not rows:
     print(f"No entries for {chart_name} on {date_str}")
     return
 
   header = f"{chart_name} — {date_str} — {len(rows)} entries"
-  print(header)
-  print("-" * len(header))
-
-  colw = {
-      "rank": 4, "title": 40, "artist": 28,
-      "lastPos": 7, "peakPos": 7, "weeks": 5, "isNew": 3
-  }
-  print(f"{'Rk':<{colw['rank']}}  {'Title':<{colw['title']}}  {'Artist':<{colw['artist']}}  "
-        f"{'Last':<{colw['lastPos']}}  {'Peak':<{colw['peakPos']}}  {'Wks':<{colw['weeks']}}  "
-        f"{'New':<{colw['isNew']}}")
-  print("-" * (sum(colw.values()) + 14))
-
-  for r in rows:
-    title = (r['title'][:colw['title']-1] + "…") if len(str(r['title'])) > colw['title'] else r['title']
-    artist = (r['artist'][:colw['artist']-1] + "…") if len(str(r['artist'])) > colw['artist'] else r['artist']
-    new_flag = "Y" if r.get("isNew") else ""
-    print(f"{r['rank']:<{colw['rank']}}  {title:<{colw['title']}}  {artist:<{colw['artist']}}  "
-          f"{(r['lastPos'] if r['lastPos'] is not None else ''):<{colw['lastPos']}}  "
-          f"{(r['peakPos'] if r['peakPos'] is not None else ''):<{colw['peakPos']}}  "
-          f"{(r['weeks'] if r['weeks'] is not None else ''):<{colw['weeks']}}  "
-          f"{new_flag:<{colw['isNew']}}")
-  print("\n(‘New’ reflects ChartEntry.isNew; artwork URL is in the 'image' field.)")
+  tw, aw = COLW["title"], COLW["artist"]
+  lines = [
+      header,
+      "-" * len(header),
+      ROW_FMT.format("Rk", "Title", "Artist", "Last", "Peak", "Wks", "New"),
+      "-" * (sum(COLW.values()) + 14),
+  ]
+  lines.extend(
+      ROW_FMT.format(
+          rank,
+          _trim(title, tw),
+          _trim(artist, aw),
+          last_pos if last_pos is not None else '',
+          peak_pos if peak_pos is not None else '',
+          weeks if weeks is not None else '',
+          "Y" if is_new else "",
+      )
+      for rank, title, artist, last_pos, peak_pos, weeks, is_new, _image in rows.tuples()
+  )
+  lines.append("\n(‘New’ reflects ChartEntry.isNew; artwork URL is in the 'image' field.)")
+  sys.stdout.write("\n".join(lines) + "\n")
 
 
 def main():
   args = parse_args()
   date_str = validate_date(args.date)
+  use_fast_html_parser()
 
   try:
     chart = billboard.ChartData(args.chart, date=date_str, timeout=args.timeout)
@@ -105,22 +137,21 @@ def main():
   print_table(rows, args.chart, chart.date)
 
   if args.json:
-    with open(args.json, "w", encoding="utf-8") as f:
-      json.dump({
+    with open(args.json, "wb") as f:
+      f.write(dump_json({
           "chart": args.chart,
           "date": chart.date,
           "previousDate": chart.previousDate,
           "nextDate": chart.nextDate,
-          "entries": rows
-      }, f, ensure_ascii=False, indent=2)
+          "entries": rows.records()
+      }))
     print(f"Saved JSON to {args.json}")
 
   if args.csv:
     with open(args.csv, "w", newline="", encoding="utf-8") as f:
-      w = csv.DictWriter(f, fieldnames=FIELDS)
-      w.writeheader()
-      for r in rows:
-        w.writerow({k: r.get(k, "") for k in FIELDS})
+      w = csv.writer(f)
+      w.writerow(FIELDS)
+      w.writerows(rows.tuples())
     print(f"Saved CSV to {args.csv}")
 
 
@@ -19,10 +19,13 @@ Examples:
 """
 
 import argparse
+import bisect
 import sys
-import time
-from datetime import date, datetime
-import billboard  # pip install billboard.py
+from datetime import date
+from _billboard_export import (
+    FETCH_CONCURRENCY, VALID_DATES_CHART, RateLimiter, get_chart, load_valid_dates, parse_iso_date,
+    run_in_threads, share_http_session, use_fast_html_parser,
+)
 
 # A small starter list. You can pass any valid slug via --chart.
 KNOWN_CHARTS = [
@@ -43,34 +46,91 @@ KNOWN_CHARTS = [
 
 
 def parse_date(s: str) -> date:
-  return datetime.strptime(s, "%Y-%m-%d").date()
+  return parse_iso_date(s)
 
 
-def within_bounds(dstr: str, start: date | None, end: date | None) -> bool:
+def within_bounds(dstr: str, start: str | None, end: str | None) -> bool:
+  # YYYY-MM-DD strings sort like the dates they spell, so no parsing needed
   if not dstr:
     return False
-  d = parse_date(dstr)
-  if start and d < start:
+  if start and dstr < start:
     return False
-  if end and d > end:
+  if end and dstr > end:
     return False
   return True
 
 
 def iter_weeks(chart_name: str, start: date | None = None, end: date | None = None,
+               polite_sleep: float = 0.2, limit: int | None = None, timeout: float = 25.0):
+  """
+  Yield YYYY-MM-DD strings for all available weeks of a given chart, latest
+  first.
+
+  Hot 100 weeks come straight from the published valid-dates list. For other
+  charts those dates are candidate weeks, confirmed by fetching them
+  concurrently; the newest is fetched first so a bad slug fails after one
+  request. Raises RuntimeError, after yielding the weeks that were found, if
+  any candidate couldn't be fetched. If the list can't be loaded, fall back
+  to walking backward via .previousDate.
+  """
+  try:
+    dates = load_valid_dates(timeout)
+  except RuntimeError as exc:
+    print(f"{exc}; walking weeks one at a time instead.", file=sys.stderr)
+    yield from walk_weeks(chart_name, start, end, polite_sleep, limit)
+    return
+
+  lo, hi = (start.isoformat() if start else None), (end.isoformat() if end else None)
+  # dates is sorted, so the bounds are a single slice
+  first = bisect.bisect_left(dates, lo) if lo else 0
+  last = bisect.bisect_right(dates, hi) if hi else len(dates)
+  candidates = dates[first:last][::-1]
+  if limit:
+    candidates = candidates[:limit]
+  if chart_name == VALID_DATES_CHART:
+    yield from candidates
+    return
+
+  limiter = RateLimiter.from_interval(polite_sleep)
+
+  def fetch_week(d: str) -> str | None:
+    chart = get_chart(chart_name, limiter, date=d, timeout=timeout)
+    return chart.date if chart else None
+
+  if not candidates:
+    return
+  # Raises straight away (e.g. BillboardNotFoundException) for a misspelled slug
+  results = [fetch_week(candidates[0])]
+
+  def report(d: str, exc: Exception):
+    print(f"Failed to fetch '{chart_name}' for {d}: {exc}", file=sys.stderr)
+
+  results += run_in_threads(fetch_week, candidates[1:], on_error=report)
+  # A candidate can resolve to the nearest available week, so dedupe and re-check bounds
+  found = {r for r in results if isinstance(r, str) and within_bounds(r, lo, hi)}
+  yield from sorted(found, reverse=True)
+  failed = sum(isinstance(r, Exception) for r in results)
+  if failed:
+    raise RuntimeError(f"{failed} of {len(candidates)} weeks could not be fetched")
+
+
+def walk_weeks(chart_name: str, start: date | None = None, end: date | None = None,
                polite_sleep: float = 0.2, limit: int | None = None):
   """
-  Yield YYYY-MM-DD strings for all available weeks of a given chart by
-  walking backward via .previousDate starting from latest.
+  Yield weeks by walking backward via .previousDate starting from latest.
+  Requests are spaced at most one per `polite_sleep` seconds, counting the
+  request itself.
   """
   count = 0
+  lo, hi = (start.isoformat() if start else None), (end.isoformat() if end else None)
+  limiter = RateLimiter.from_interval(polite_sleep)
   # Get the latest chart first
-  chart = billboard.ChartData(chart_name)  # date=None => latest
+  chart = get_chart(chart_name, limiter)  # date=None => latest
   # Walk backwards
   while chart and chart.date:
     dstr = chart.date
     if (start or end):
-      if within_bounds(dstr, start, end):
+      if within_bounds(dstr, lo, hi):
         yield dstr
     else:
       yield dstr
@@ -82,30 +142,30 @@ def iter_weeks(chart_name: str, start: date | None = None, end: date | None = No
     if not chart.previousDate:
       break
 
-    time.sleep(polite_sleep)  # be gentle
-    chart = billboard.ChartData(chart_name, date=chart.previousDate)
+    chart = get_chart(chart_name, limiter, date=chart.previousDate)  # limiter keeps it gentle
 
 
-def list_year_end_years(chart_name: str, min_year: int = 1958, max_year: int | None = None):
+def list_year_end_years(chart_name: str, min_year: int = 1958, max_year: int | None = None,
+                        polite_sleep: float = 0.1, workers: int = FETCH_CONCURRENCY):
   """
   Year-end charts are requested with year='YYYY'.
-  Billboard doesn’t expose a direct list, so we probe a reasonable range.
+  Billboard doesn’t expose a direct list, so we probe a reasonable range,
+  `workers` years at a time.
   """
-  years_found = []
   if max_year is None:
     max_year = date.today().year
 
-  for y in range(max_year, min_year - 1, -1):
-    try:
-      ch = billboard.ChartData(chart_name, year=str(y))
-      # If this year-end chart has entries, consider it present.
-      if ch and len(ch) > 0:
-        years_found.append(y)
-    except Exception:
-      # Not available for this year, skip quietly
-      pass
-    time.sleep(0.1)
-  return sorted(years_found)
+  limiter = RateLimiter.from_interval(polite_sleep)
+
+  def probe_year(y: int) -> int | None:
+    ch = get_chart(chart_name, limiter, year=str(y))
+    # If this year-end chart has entries, consider it present.
+    return y if ch and len(ch) > 0 else None
+
+  years = range(min_year, max_year + 1)
+  results = run_in_threads(probe_year, years, workers)
+  # Missing years raise or come back empty; skip them quietly
+  return sorted(r for r in results if isinstance(r, int))
 
 
 def main():
@@ -126,6 +186,8 @@ def main():
   else:
     chart = args.chart.strip()
 
+  share_http_session()
+  use_fast_html_parser()
   start = parse_date(args.start) if args.start else None
   end = parse_date(args.end) if args.end else None
 
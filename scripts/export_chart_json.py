@@ -1,18 +1,24 @@
 #!/usr/bin/env python3
 # pip install billboard.py
+# Optional: pip install requests-cache  (caches fetched chart pages on disk)
+#           pip install orjson          (faster JSON encoding)
+#           pip install lxml            (faster chart page parsing)
+#           pip install zstandard       (--zstd)
 # Usage:
 #   python export_chart_json.py --chart hot-100 --date 1958-08-04
 #   python export_chart_json.py --chart rock-songs --date 2025-10-11 --out rock-2025-10-11.json
+#   python export_chart_json.py --chart hot-100 --since 2025-01-04 --refresh
+#   python export_chart_json.py --chart hot-100 country-songs rap-song --since 2025-01-04
+#   python export_chart_json.py --chart hot-100 --since 1958-08-04 --aggregate hot-100.jsonl.zst --zstd
 
 import argparse
-import json
+import bisect
 import sys
-import os
-from datetime import datetime
-from urllib.request import Request, urlopen
-import billboard  # billboard.py
+from _billboard_export import (
+    DEFAULT_RATE, DEFAULT_RETRIES, FETCH_CONCURRENCY, JsonlWriter, export_chart, export_weeks, install_http_cache,
+    load_valid_dates, parse_iso_date, share_http_session, use_fast_html_parser,
+)
 
-VALID_DATES_URL = "https://raw.githubusercontent.com/mhollingshead/billboard-hot-100/main/valid_dates.json"
 ALLOWED_CHARTS = {
     "hot-100",
     "alternative-airplay",
@@ -24,118 +30,111 @@ ALLOWED_CHARTS = {
 }
 
 
+def int_at_least(minimum: int):
+  """argparse type for ints no smaller than `minimum`."""
+  def parse(s: str) -> int:
+    value = int(s)
+    if value < minimum:
+      raise argparse.ArgumentTypeError(f"must be at least {minimum}, got {value}")
+    return value
+  parse.__name__ = "int"  # argparse names the type in "invalid int value" errors
+  return parse
+
+
 def parse_args():
   parser = argparse.ArgumentParser(description="Export a Billboard chart week to JSON in standardized format.")
-  parser.add_argument("--chart", "-c", required=True,
-                      help="Chart slug (allowed: hot-100, alternative-airplay, country-songs, "
+  parser.add_argument("--chart", "-c", required=True, nargs="+",
+                      help="One or more chart slugs (allowed: hot-100, alternative-airplay, country-songs, "
                            "hot-mainstream-rock-tracks, latin-airplay, r-and-b-songs, rap-song)")
   group = parser.add_mutually_exclusive_group(required=True)
   group.add_argument("--date", "-d", help="Week date YYYY-MM-DD")
   group.add_argument("--since", help="Fetch all weeks from this date through latest (YYYY-MM-DD).")
-  parser.add_argument("--out", "-o", help="Output JSON file (optional, defaults to <chart>-<date>.json)")
+  parser.add_argument("--out", "-o",
+                      help="Output JSON file for a single chart and --date (optional, defaults to <chart>-<date>.json)")
   parser.add_argument("--timeout", type=float, default=25.0, help="HTTP timeout seconds (default: 25)")
+  parser.add_argument("--max-retries", type=int_at_least(0), default=DEFAULT_RETRIES,
+                      help=f"Retries per week after timeouts, 429s or 5xx errors (default: {DEFAULT_RETRIES})")
+  parser.add_argument("--workers", type=int_at_least(1), default=FETCH_CONCURRENCY,
+                      help=f"Chart weeks fetched in parallel (default: {FETCH_CONCURRENCY})")
+  parser.add_argument("--rate", type=float, default=DEFAULT_RATE,
+                      help=f"Max Billboard requests per second, 0 for unlimited (default: {DEFAULT_RATE:g})")
+  parser.add_argument("--aggregate", metavar="PATH",
+                      help="Append each week as one line to this JSON Lines file instead of writing per-week files. "
+                           "Weeks already in the file are skipped; lines are in completion order, not date order")
+  parser.add_argument("--zstd", action="store_true", help="zstd-compress the --aggregate file (needs zstandard)")
+  parser.add_argument("--force", action="store_true",
+                      help="Re-export weeks already in their default output file or the --aggregate file "
+                           "(skipped otherwise)")
+  parser.add_argument("--refresh", action="store_true",
+                      help="Clear the on-disk chart page cache before fetching")
   return parser.parse_args()
 
 
 def validate_date(s: str) -> str:
   try:
-    datetime.strptime(s, "%Y-%m-%d")
+    parse_iso_date(s)
     return s
   except ValueError:
     print(f"Invalid date '{s}' (expected YYYY-MM-DD)", file=sys.stderr)
     sys.exit(2)
 
 
-def load_valid_dates(timeout: float) -> list[str]:
-  req = Request(VALID_DATES_URL, headers={"User-Agent": "billboard-trivia/1.0"})
-  try:
-    with urlopen(req, timeout=timeout) as resp:
-      payload = resp.read().decode("utf-8")
-  except Exception as exc:
-    print(f"Failed to fetch valid dates list: {exc}", file=sys.stderr)
-    sys.exit(1)
-  try:
-    data = json.loads(payload)
-  except json.JSONDecodeError as exc:
-    print(f"Failed to parse valid dates JSON: {exc}", file=sys.stderr)
-    sys.exit(1)
-  if not isinstance(data, list) or not all(isinstance(d, str) for d in data):
-    print("Valid dates payload is not a list of strings.", file=sys.stderr)
-    sys.exit(1)
-  return sorted(set(data))
-
-
-def export_chart(chart_slug: str, week: str, out_path: str | None, timeout: float = 25.0):
-  print(f"Fetching chart '{chart_slug}' for week {week} ...")
-  chart = billboard.ChartData(chart_slug, date=week, timeout=timeout)
-
-  if not chart:
-    print(f"No chart returned for {chart_slug} on {week}", file=sys.stderr)
-    sys.exit(1)
-
-  # Construct entries
-  data = []
-  for e in chart:
-    last_week = None if (e.lastPos is None or e.lastPos == 0) else e.lastPos
-    entry = {
-        "song": e.title,
-        "artist": e.artist,
-        "this_week": e.rank,
-        "last_week": last_week,
-        "peak_position": e.peakPos,
-        "weeks_on_chart": e.weeks,
-        "new": bool(getattr(e, "isNew", False))
-    }
-    data.append(entry)
-
-  payload = {"date": chart.date, "data": data}
-
-  # If no output path provided, build one
-  if not out_path:
-    safe_chart = chart_slug.replace("/", "-")
-    out_path = f"public/charts/{safe_chart}/{safe_chart}-{chart.date}.json"
-    # Avoid accidental overwrite
-    if os.path.exists(out_path):
-      n = 1
-      while os.path.exists(f"public/charts/{safe_chart}/{safe_chart}-{chart.date}-{n}.json"):
-        n += 1
-      out_path = f"public/charts/{safe_chart}/{safe_chart}-{chart.date}-{n}.json"
-
-  # Ensure output directory exists
-  out_dir = os.path.dirname(out_path)
-  if out_dir:
-    os.makedirs(out_dir, exist_ok=True)
-
-  # Write JSON
-  with open(out_path, "w", encoding="utf-8") as f:
-    json.dump(payload, f, ensure_ascii=False, indent=2)
-
-  if chart.date != week:
-    print(f"Note: requested {week}, got nearest available {chart.date}.", file=sys.stderr)
-  print(f"Wrote {len(data)} entries to {out_path}")
-
-
 def main():
   args = parse_args()
-  chart = args.chart.strip()
-  if chart not in ALLOWED_CHARTS:
-    print(f"Chart '{chart}' is not allowed. Allowed charts: {', '.join(sorted(ALLOWED_CHARTS))}.", file=sys.stderr)
+  charts = list(dict.fromkeys(c.strip() for c in args.chart))
+  for chart in charts:
+    if chart not in ALLOWED_CHARTS:
+      print(f"Chart '{chart}' is not allowed. Allowed charts: {', '.join(sorted(ALLOWED_CHARTS))}.", file=sys.stderr)
+      sys.exit(2)
+  if args.out and args.since:
+    print("--out writes a single week; omit it with --since to write one file per week, or use --aggregate.",
+          file=sys.stderr)
+    sys.exit(2)
+  if args.out and len(charts) > 1:
+    print("--out needs a single --chart; omit it to write each chart under public/charts/.", file=sys.stderr)
+    sys.exit(2)
+  if args.aggregate and args.out:
+    print("--aggregate and --out can't be used together.", file=sys.stderr)
+    sys.exit(2)
+  if args.zstd and not args.aggregate:
+    print("--zstd only applies to --aggregate output.", file=sys.stderr)
     sys.exit(2)
-  if args.since:
-    since = validate_date(args.since)
+  to_fetch = [validate_date(args.date)] if args.date else []
+  since = validate_date(args.since) if args.since else None
+  try:
     dates = load_valid_dates(args.timeout)
-    if since not in dates:
+  except RuntimeError as exc:
+    if since:
+      print(exc, file=sys.stderr)
+      sys.exit(1)
+    print(f"{exc}; chart pages won't be cached.", file=sys.stderr)
+    dates = []
+  if since:
+    first = bisect.bisect_left(dates, since)
+    if first == len(dates) or dates[first] != since:
       print(f"'since' date {since} is not in the valid dates list.", file=sys.stderr)
       sys.exit(2)
-    to_fetch = [d for d in dates if d >= since]
-    if not to_fetch:
-      print(f"No weeks found on or after {since}.", file=sys.stderr)
-      sys.exit(1)
-    for week in to_fetch:
-      export_chart(chart, week, args.out, args.timeout)
-  else:
-    week = validate_date(args.date)
-    export_chart(chart, week, args.out, args.timeout)
+    to_fetch = dates[first:]
+  install_http_cache(refresh=args.refresh, settled_through=dates[-1] if dates else None)
+  share_http_session(args.workers)
+  use_fast_html_parser()
+  try:
+    aggregate = JsonlWriter(args.aggregate, compress=args.zstd, force=args.force) if args.aggregate else None
+  except RuntimeError as exc:
+    print(exc, file=sys.stderr)
+    sys.exit(2)
+  try:
+    if len(charts) == 1 and args.date:
+      export_chart(charts[0], to_fetch[0], args.out, args.timeout, aggregate, args.force, args.max_retries)
+    else:
+      failed = export_weeks(charts, to_fetch, args.out, args.timeout, workers=args.workers, rate=args.rate,
+                            aggregate=aggregate, force=args.force, retries=args.max_retries)
+      if failed:
+        print(f"{failed} of {len(charts) * len(to_fetch)} chart weeks failed.", file=sys.stderr)
+        sys.exit(1)
+  finally:
+    if aggregate:
+      aggregate.close()
 
 
 if __name__ == "__main__":